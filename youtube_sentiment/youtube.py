@@ -4,14 +4,417 @@ Classes
 -------
 YoutubeObject
     A generic Youtube object. Has a youtube_api method to make API calls
+RateLimiter
+    A token bucket that keeps api requests under the rate limit
+OrjsonModel
+    Decodes api responses with orjson, used when it's installed
 """
 
-import traceback
-from functools import cached_property
-from time import sleep
-
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+from collections.abc import AsyncIterable, AsyncIterator, Awaitable, Callable
+from datetime import datetime
+from functools import cache, wraps
+from pathlib import Path
+from time import monotonic, sleep, time
+from typing import TypeVar
+
+import httplib2
 import polars as pl
-from googleapiclient.discovery import build
+from googleapiclient.discovery import Resource, build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest, HttpRequest, build_http
+from googleapiclient.model import JsonModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Max number of api requests in flight at once when fetching batches concurrently
+MAX_CONCURRENT_REQUESTS = 8
+
+# Max number of requests to pack into one batch http request
+MAX_BATCH_REQUESTS = 50
+
+# Http statuses worth retrying, the api is throttling us or having a bad time
+RETRY_STATUSES = frozenset({429, 500, 503})
+
+# How many times to try a request before giving up on it
+MAX_ATTEMPTS = 5
+
+# Api error reasons that mean one video's comments can't be read, eg it's private or
+# deleted, rather than something wrong with every request like quotaExceeded
+UNREADABLE_VIDEO_REASONS = frozenset({"forbidden", "videoNotFound"})
+
+# Api responses can be cached on disk between runs, handy when rerunning the same
+# fetches while working on the analysis. It's off by default, set CACHE_TTL to the
+# number of seconds a cached response stays good for to turn it on. CACHE_DIR
+# defaults to $XDG_CACHE_HOME/youtube_sentiment, or ~/.cache/youtube_sentiment
+CACHE_DIR: Path | None = None
+CACHE_TTL = 0
+
+# The api's timestamps are all RFC 3339 in UTC
+TIMESTAMP = pl.Datetime("us", "UTC")
+
+COMMENT_SCHEMA = {
+    "comment": pl.Utf8,
+    "comment_dt": TIMESTAMP,
+    "user_name": pl.Utf8,
+    "like_cnt": pl.Int64,
+    "reply_cnt": pl.Int64,
+    "replies": pl.List(pl.Utf8),
+}
+
+# Comments fetched for a whole channel also say which video they're on
+CHANNEL_COMMENT_SCHEMA = {"video_id": pl.Utf8, **COMMENT_SCHEMA}
+
+VIDEO_SCHEMA = {
+    "video_id": pl.Utf8,
+    "published_dt": TIMESTAMP,
+    "video_title": pl.Utf8,
+    "video_description": pl.Utf8,
+    "video_tags": pl.List(pl.Utf8),
+    "view_cnt": pl.Int64,
+    "like_cnt": pl.Int64,
+    "fave_cnt": pl.Int64,
+    "comment_cnt": pl.Int64,
+}
+
+
+class RateLimiter:
+    """A thread safe token bucket to keep api requests under the rate limit.
+
+    Each request takes a token from the bucket, and the bucket refills at a steady
+    rate. Requests can burst up to the size of the bucket, then get spaced out to
+    the refill rate.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        """Construct a RateLimiter.
+
+        Attributes
+        ----------
+        rate : float
+            The number of tokens added to the bucket per second
+        burst : int
+            The most tokens the bucket can hold
+
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 1) -> None:
+        """Take tokens from the bucket, blocking until enough are available.
+
+        Parameters
+        ----------
+        tokens : int
+            How many tokens to take, one per api request. No more than burst
+
+        """
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            sleep(wait)
+
+
+# Shared by every Youtube object, the limit applies to all of our requests
+rate_limiter = RateLimiter(rate=10, burst=100)
+
+# Each thread's own connection pool, see _thread_http
+_thread_local = threading.local()
+
+# When the cache was last cleared of expired responses, see _prune_cache
+_last_prune = float("-inf")
+
+
+class OrjsonModel(JsonModel):
+    """Decode api responses with orjson rather than the standard library json.
+
+    Comment threads come back as big nested json, which orjson parses several
+    times faster. Anything orjson won't parse falls back to JsonModel.
+    """
+
+    def deserialize(self, content: bytes | str) -> dict | str:
+        """Decode a response body.
+
+        Parameters
+        ----------
+        content : bytes | str
+            The body of the api response
+
+        Returns
+        -------
+        dict | str
+            The decoded json, or the content as a str if it isn't json
+
+        """
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return super().deserialize(content)
+        if self._data_wrapper and "data" in body:
+            body = body["data"]
+        return body
+
+
+@cache
+def _build_api(api_key: str) -> Resource:
+    """Build the youtube api once per api key, for every Youtube object to share.
+
+    Responses are decoded with orjson if it's installed.
+    """
+    model = OrjsonModel() if orjson is not None else None
+    return build("youtube", "v3", developerKey=api_key, model=model)
+
+
+def _thread_http() -> httplib2.Http:
+    """Get the connection for the current thread, creating it on first use.
+
+    httplib2 connections aren't thread safe, so they can't be shared between the
+    worker threads requests run in. Giving each thread its own lets every request
+    on that thread reuse its open connections instead of a new handshake each time.
+    build_http sets the same socket timeout the client uses by default, so a stalled
+    connection times out and gets retried rather than hanging the thread.
+    """
+    if not hasattr(_thread_local, "http"):
+        _thread_local.http = build_http()
+    return _thread_local.http
+
+
+def _count(stats: dict, key: str) -> int | None:
+    """Get a video statistic as an int, or None if the api left it out.
+
+    The api sends video statistics as strings, and leaves them out when they're
+    hidden, eg likeCount when likes are hidden or commentCount when comments are off.
+    """
+    value = stats.get(key)
+    return int(value) if value is not None else None
+
+
+def _dumps(response: dict) -> bytes:
+    """Encode a response for the cache, with orjson if it's installed."""
+    if orjson is not None:
+        return orjson.dumps(response)
+    return json.dumps(response).encode()
+
+
+def _loads(content: bytes) -> dict:
+    """Decode a response from the cache, with orjson if it's installed."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _cache_dir() -> Path:
+    """Where to cache api responses, CACHE_DIR if it's set.
+
+    Worked out when it's needed rather than at import, finding the home directory
+    can fail and that shouldn't stop the module importing.
+    """
+    if CACHE_DIR is not None:
+        return CACHE_DIR
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if cache_home:
+        return Path(cache_home) / "youtube_sentiment"
+    return Path.home() / ".cache" / "youtube_sentiment"
+
+
+def _prune_cache(cache_dir: Path) -> None:
+    """Delete cached responses that are past CACHE_TTL, at most once per CACHE_TTL.
+
+    Expired responses never get read again, so without this the cache would grow
+    forever. Leftover temp files from interrupted writes go too.
+    """
+    global _last_prune
+    if monotonic() - _last_prune < CACHE_TTL:
+        return
+    _last_prune = monotonic()
+
+    now = time()
+    for path in [*cache_dir.glob("*.json"), *cache_dir.glob("*.tmp")]:
+        with contextlib.suppress(OSError):
+            if now - path.stat().st_mtime >= CACHE_TTL:
+                path.unlink(missing_ok=True)
+
+
+def _disk_cached(execute: Callable[..., dict | None]) -> Callable[..., dict | None]:
+    """Cache the responses of an execute function on disk, if CACHE_TTL is set.
+
+    Responses are keyed by a hash of the request's method, uri and body, and are
+    reused until they're CACHE_TTL seconds old. Batch requests hand their responses
+    to callbacks, so they always go to the api.
+    """
+
+    @wraps(execute)
+    def cached_execute(
+        request: HttpRequest | BatchHttpRequest, *args, **kwargs
+    ) -> dict | None:
+        if CACHE_TTL <= 0 or not isinstance(request, HttpRequest):
+            return execute(request, *args, **kwargs)
+
+        try:
+            cache_dir = _cache_dir()
+        except RuntimeError:
+            # no home directory to cache in
+            logger.debug("Couldn't find a cache directory", exc_info=True)
+            return execute(request, *args, **kwargs)
+
+        key = f"{request.method} {request.uri} {request.body}"
+        path = cache_dir / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+        try:
+            if time() - path.stat().st_mtime < CACHE_TTL:
+                return _loads(path.read_bytes())
+        except (OSError, ValueError):
+            # missing or unreadable, either way go to the api
+            pass
+
+        response = execute(request, *args, **kwargs)
+        tmp_path = None
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            _prune_cache(cache_dir)
+            # write then rename, so nothing else ever reads a half written file
+            with tempfile.NamedTemporaryFile(
+                dir=cache_dir, suffix=".tmp", delete=False
+            ) as tmp_file:
+                tmp_path = Path(tmp_file.name)
+                tmp_file.write(_dumps(response))
+            tmp_path.replace(path)
+        except OSError:
+            # a cache we can't write to shouldn't cost us a good response
+            logger.debug("Couldn't cache response in %s", cache_dir, exc_info=True)
+            if tmp_path is not None:
+                with contextlib.suppress(OSError):
+                    tmp_path.unlink(missing_ok=True)
+        return response
+
+    return cached_execute
+
+
+def _comments_disabled(error: HttpError) -> bool:
+    """Whether the api refused a commentThreads request because comments are off."""
+    return b"commentsDisabled" in error.content
+
+
+def _error_reason(error: HttpError) -> str:
+    """The reason the api gave for an error, eg "quotaExceeded", or "" if none."""
+    try:
+        return _loads(error.content)["error"]["errors"][0]["reason"]
+    except (ValueError, TypeError, KeyError, IndexError):
+        return ""
+
+
+def _retry_delay(
+    error: HttpError | ConnectionError | TimeoutError,
+    attempt: int,
+    base_delay: float = 1.0,
+    max_delay: float = 32.0,
+) -> float:
+    """How long to wait before retrying a request that failed.
+
+    Waits for the Retry-After header if the api sends one, otherwise backs off
+    exponentially with some jitter so concurrent requests don't retry in lockstep.
+
+    Parameters
+    ----------
+    error : HttpError | ConnectionError | TimeoutError
+        The error the request failed with
+    attempt : int
+        Which attempt just failed, starting from 1
+    base_delay : float
+        Seconds to wait before the first retry, doubled for each retry after
+    max_delay : float
+        The longest we'll wait between retries, in seconds
+
+    Returns
+    -------
+    float
+        The seconds to wait
+
+    """
+    retry_after = ""
+    if isinstance(error, HttpError):
+        retry_after = error.resp.get("retry-after", "")
+    if retry_after.isdigit():
+        return float(retry_after)
+    delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+    return delay + random.uniform(0, base_delay)
+
+
+@_disk_cached
+def _execute_with_retry(
+    request: HttpRequest | BatchHttpRequest,
+    http: httplib2.Http | None = None,
+    max_attempts: int = MAX_ATTEMPTS,
+    cost: int = 1,
+) -> dict | None:
+    """Execute an api request, backing off and retrying if it's throttled.
+
+    Waits between attempts as long as _retry_delay says to. Dropped connections and
+    timeouts are retried the same way. Anything else, or running out of attempts, is
+    logged and raised so a failure can't pass for a complete result.
+
+    Parameters
+    ----------
+    request : HttpRequest | BatchHttpRequest
+        The api request to execute
+    http : httplib2.Http | None
+        The connection to execute the request with, defaults to this thread's own
+    max_attempts : int
+        How many times to try the request before giving up
+    cost : int
+        How many rate limiter tokens each attempt takes, one per request in a batch
+
+    Returns
+    -------
+    dict | None
+        The api response. Batch requests hand their responses to callbacks instead
+
+    """
+    # log the method and status rather than the uri or error message, which both have
+    # our api key in them
+    name = request.methodId if isinstance(request, HttpRequest) else "batch request"
+    if http is None:
+        http = _thread_http()
+    for attempt in range(1, max_attempts + 1):
+        rate_limiter.acquire(cost)
+        try:
+            return request.execute(http=http)
+        except (HttpError, ConnectionError, TimeoutError) as e:
+            reason = e.resp.status if isinstance(e, HttpError) else type(e).__name__
+            transient = not isinstance(e, HttpError) or e.resp.status in RETRY_STATUSES
+            if not transient or attempt == max_attempts:
+                logger.error("%s failed (%s), giving up", name, reason)
+                raise
+
+            delay = _retry_delay(e, attempt)
+            logger.warning("%s failed (%s), retrying in %.1fs", name, reason, delay)
+            sleep(delay)
 
 
 class Youtube:
@@ -28,10 +431,98 @@ class Youtube:
         """
         self.api_key = api_key
 
-    @cached_property
-    def api(self) -> None:
-        """If the youtube api isn't built, do so."""
-        return build("youtube", "v3", developerKey=self.api_key)
+    @property
+    def api(self) -> Resource:
+        """The youtube api, shared with every other Youtube object using this key."""
+        return _build_api(self.api_key)
+
+    async def _execute_async(self, request: HttpRequest) -> dict:
+        """Execute an api request in a worker thread so requests can overlap."""
+        return await asyncio.to_thread(_execute_with_retry, request)
+
+    @staticmethod
+    async def _gather_batches(
+        fetch_batch: Callable[[T], Awaitable[R]],
+        batches: AsyncIterable[T],
+    ) -> list[R]:
+        """Fetch all the batches concurrently, at most MAX_CONCURRENT_REQUESTS at once.
+
+        Each batch starts fetching as soon as it arrives, so a batch can be fetched
+        while the next one is still being paged in.
+
+        Parameters
+        ----------
+        fetch_batch : Callable[[T], Awaitable[R]]
+            The coroutine function that fetches a single batch
+        batches : AsyncIterable[T]
+            The batches to fetch
+
+        Returns
+        -------
+        list[R]
+            One result per batch, in the same order as batches
+
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+        async def bounded_fetch(batch: T) -> R:
+            async with semaphore:
+                return await fetch_batch(batch)
+
+        tasks: list[asyncio.Task[R]] = []
+        try:
+            async for batch in batches:
+                tasks.append(asyncio.create_task(bounded_fetch(batch)))
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    @staticmethod
+    async def _write_batch(df: pl.DataFrame, path: Path) -> Path:
+        """Write a batch to its own parquet file, off the event loop.
+
+        The batch is written to a temp file then renamed, so a run that dies part way
+        through never leaves a half written file that looks like a finished batch.
+
+        Parameters
+        ----------
+        df : pl.DataFrame
+            The batch to write
+        path : Path
+            The parquet file to write the batch to
+
+        Returns
+        -------
+        Path
+            The parquet file the batch was written to
+
+        """
+        tmp_path = path.with_suffix(".parquet.tmp")
+        await asyncio.to_thread(df.write_parquet, tmp_path)
+        tmp_path.replace(path)
+        return path
+
+    @staticmethod
+    def _scan_batches(paths: list[Path], schema: dict) -> pl.LazyFrame:
+        """Lazily read back the parquet files written by _write_batch.
+
+        Parameters
+        ----------
+        paths : list[Path]
+            The parquet files, one per batch
+        schema : dict
+            The schema to use if there weren't any batches
+
+        Returns
+        -------
+        pl.LazyFrame
+
+        """
+        if not paths:
+            return pl.LazyFrame(schema=schema)
+        return pl.concat([pl.scan_parquet(path) for path in paths])
 
 
 class Video(Youtube):
@@ -51,125 +542,119 @@ class Video(Youtube):
         self.video_id = video_id
         super().__init__(api_key)
 
-    @cached_property
-    def comment_threads(self) -> list[str]:
-        """The list of comment thread ids for this video."""
-        request = self.api.commentThreads().list(
-            part="id",
-            videoId=self.video_id,
-            maxResults=100,
-        )
-        comment_threads = []
-
-        while request:
-            try:
-                response = request.execute()
-
-                for item in response["items"]:
-                    if item["kind"] == "youtube#commentThread":
-                        comment_threads.append(item["id"])
-                request = self.api.commentThreads().list_next(request, response)
-            except Exception as e:
-                print(str(e))
-                print(traceback.format_exc())
-                break
-        sleep(1)  # nap to avoid breaking the api
-        return comment_threads
-
-    def fetch_comments(self) -> pl.DataFrame:
+    def fetch_comments(
+        self, out_path: str | Path | None = None
+    ) -> pl.DataFrame | pl.LazyFrame:
         """Fetch all the comments for the given video.
 
-        _fetch_comment_batch does the heavy lifting, this just iterates over the
-        comment_threads for the video.
-        """
-        df = pl.DataFrame(
-            schema={
-                "comment": str,
-                "comment_dt": str,
-                "user_name": str,
-                "like_cnt": str,
-                "reply_cnt": str,
-                "replies": list[str],
-            }
-        )
+        Runs fetch_comments_async in a new event loop. From inside a running event
+        loop (eg a notebook), await fetch_comments_async instead.
+
+        Parameters
+        ----------
+        out_path : str | Path | None
+            If given, write each page of comments to a parquet file in this directory
+            and return a LazyFrame over them rather than holding them all in memory.
+            See fetch_comments_async for why comment runs can't be resumed
 
-        for i in range(0, len(self.comment_threads), 50):
-            comment_batch = self.comment_threads[i : i + 50]
-            df2 = self._fetch_comment_batch(comment_batch)
-            sleep(1)  # nap to avoid breaking the api
-            df = pl.concat([df, df2])
+        """
+        return asyncio.run(self.fetch_comments_async(out_path))
 
-        return df
+    async def fetch_comments_async(
+        self, out_path: str | Path | None = None
+    ) -> pl.DataFrame | pl.LazyFrame:
+        """Fetch all the comments for the given video.
 
-    def _fetch_comment_batch(self, comment_batch: list[str]) -> pl.DataFrame:
-        """Goes and gets info for this batch of comments.
+        Pages through the commentThreads for the video, getting the snippet and replies
+        for up to 100 threads per request. _parse_comment_response does the heavy
+        lifting on each page. A video with comments disabled has no comments.
 
         Parameters
         ----------
-        comment_batch : list[str]
-            The commentThread ids to pull in this batch
-
-        Returns
-        -------
-        pl.DataFrame
+        out_path : str | Path | None
+            If given, write each page of comments to a parquet file in this directory
+            and return a LazyFrame over them rather than holding them all in memory.
+            Unlike fetch_videos, a rerun can't pick up where a failed one left off:
+            each page is only reachable through the token on the page before it, so
+            resuming would mean fetching every page again anyway. The page files are
+            overwritten on each run
 
         """
-        comments: list[str] = []
-        comment_dts: list[str] = []
-        user_names: list[str] = []
-        like_cnts: list[str] = []
-        reply_cnts: list[str] = []
-        replies: list[list[str]] = []
-
-        comment_ids = ",".join(comment_batch)
-
         request = self.api.commentThreads().list(
             part="snippet,replies",
-            id=comment_ids,
-            maxResults=50,
+            videoId=self.video_id,
+            maxResults=100,
         )
-        response = request.execute()
-
-        for item in response["items"]:
-            top_comment = item["snippet"]["topLevelComment"]["snippet"]
-
-            comment = top_comment["textDisplay"]
-            comments.append(comment)
+        if out_path is not None:
+            out_path = Path(out_path)
+            out_path.mkdir(parents=True, exist_ok=True)
+        frames: list[pl.DataFrame] = []
+        paths: list[Path] = []
 
-            comment_dt = top_comment["publishedAt"]
-            comment_dts.append(comment_dt)
-
-            user_name = top_comment["authorDisplayName"]
-            user_names.append(user_name)
-
-            like_cnt = top_comment["likeCount"]
-            like_cnts.append(str(like_cnt))
+        while request:
+            try:
+                response = await self._execute_async(request)
+            except HttpError as e:
+                if not _comments_disabled(e):
+                    raise
+                logger.info("Comments are disabled for %s", self.video_id)
+                if out_path is not None:
+                    return self._scan_batches([], COMMENT_SCHEMA)
+                return pl.DataFrame(schema=COMMENT_SCHEMA)
+            df = self._parse_comment_response(response)
+            if out_path is None:
+                frames.append(df)
+            else:
+                path = out_path / f"batch={len(paths)}.parquet"
+                paths.append(await self._write_batch(df, path))
+            request = self.api.commentThreads().list_next(request, response)
+
+        if out_path is not None:
+            return self._scan_batches(paths, COMMENT_SCHEMA)
+        if not frames:
+            return pl.DataFrame(schema=COMMENT_SCHEMA)
+        # concat once at the end, concatenating inside the loop copies the growing
+        # dataframe on every page
+        return pl.concat(frames)
+
+    @staticmethod
+    def _parse_comment_response(response: dict) -> pl.DataFrame:
+        """Pull the info for a page of comment threads out of the api response.
 
-            reply_cnt = item["snippet"]["totalReplyCount"]
-            reply_cnts.append(str(reply_cnt))
+        Parameters
+        ----------
+        response : dict
+            A commentThreads list response, with the snippet and replies parts
 
-            if reply_cnt > 0:
-                # start with an empyty list
-                replies.append([])
-                for reply in item["replies"]["comments"]:
-                    # extract the reply text
-                    reply = reply["snippet"]["textDisplay"]
-                    # append to the last item in the replies list
-                    replies[-1].append(reply)
-            else:
-                replies.append([])
+        Returns
+        -------
+        pl.DataFrame
 
-        df = pl.DataFrame(
+        """
+        items = response["items"]
+        # walk down to each thread's top level comment once, not once per column
+        snippets = [item["snippet"] for item in items]
+        top_comments = [snippet["topLevelComment"]["snippet"] for snippet in snippets]
+        return pl.DataFrame(
             data={
-                "comment": comments,
-                "comment_dt": comment_dts,
-                "user_name": user_names,
-                "like_cnt": like_cnts,
-                "reply_cnt": reply_cnts,
-                "replies": replies,
-            }
+                "comment": [top["textDisplay"] for top in top_comments],
+                "comment_dt": [
+                    datetime.fromisoformat(top["publishedAt"]) for top in top_comments
+                ],
+                "user_name": [top["authorDisplayName"] for top in top_comments],
+                "like_cnt": [top["likeCount"] for top in top_comments],
+                "reply_cnt": [snippet["totalReplyCount"] for snippet in snippets],
+                # threads without replies don't have a replies part
+                "replies": [
+                    [
+                        reply["snippet"]["textDisplay"]
+                        for reply in item.get("replies", {}).get("comments", [])
+                    ]
+                    for item in items
+                ],
+            },
+            schema=COMMENT_SCHEMA,
         )
-        return df
 
 
 class Channel(Youtube):
@@ -177,29 +662,36 @@ class Channel(Youtube):
 
     Notes
     -----
-    _fetch_video_batch(video_batch):
+    _fetch_video_batch_async(video_batch):
         A secret method to do the heavy lifting to retrieve the videos.
 
     Properties
     ----------
     channel_id : str
         The long-format, immutable id for a given Youtube channel.
-        Fetched from the channels api based on the class channel_handle
+        Fetched from the channels api based on the class channel_handle by prefetch
     uploads_id : str
         The id for the channels "uploads" playlist.
         This is an auto-generated playlist that contains all uploads for a channel
-        Fetched from the channels api based on the class channel_handle
+        Fetched from the channels api based on the class channel_handle by prefetch
     video_ids : list[str]
         The id for all of the videos in the channels "uploads" playlist.
         This should be all videos publically associated with a channel
         There's a chance that a user could remove a video from their uploads playlist
+        Fetched from the playlistItems api by prefetch
 
     Methods
     -------
-    fetch_videos()
+    prefetch()
+        Coroutine that fetches the channel and its video ids for the properties
+    fetch_videos(out_path=None)
         Fetch a dataframe with basic stats for all videos for this channel
-    fetch_comments(video_id)
-        Fetch a dataframe with all the comments for a video on this channel
+    fetch_videos_async(out_path=None)
+        The coroutine behind fetch_videos, for use inside a running event loop
+    fetch_all_comments()
+        Fetch a dataframe with all the comments for every video on this channel
+    fetch_all_comments_async()
+        The coroutine behind fetch_all_comments, for use inside a running event loop
 
     """
 
@@ -215,113 +707,281 @@ class Channel(Youtube):
 
         """
         self.channel_handle = channel_handle
+        self._channel_response: dict | None = None
+        self._video_ids: list[str] | None = None
         super().__init__(api_key)
 
-    @cached_property
-    def channel_id(self) -> str:
-        """If the channel ID hasn't been fetched from the api, do so.
+    async def prefetch(self) -> None:
+        """Fetch the channel and all of its video IDs from the api.
 
-        Calls the channels resource, list request, filtering by channel_handle to get
-        the channel_id from the first item in the items list. We're going to assume that
-        only one channel exists per handle and throw an error if there's two.
+        channel_id, uploads_id and video_ids are views into what this fetches, so
+        reading them doesn't hide any api calls. Prefetching several channels at once
+        runs them concurrently, eg
+        await asyncio.gather(*(channel.prefetch() for channel in channels)).
+        Outside of an event loop, use asyncio.run(channel.prefetch()).
+        """
+        await self._prefetch_channel()
+        if self._video_ids is None:
+            self._video_ids = [
+                video_id
+                async for page in self._iter_video_id_pages()
+                for video_id in page
+            ]
+
+    async def _prefetch_channel(self) -> None:
+        """If the channel hasn't been fetched from the api, do so.
+
+        Calls the channels resource, list request, filtering by channel_handle. One
+        request gets everything channel_id and uploads_id need. We're going to assume
+        that only one channel exists per handle and throw an error if there's two.
         """
+        if self._channel_response is not None:
+            return
+
         request = self.api.channels().list(
             part="id,contentDetails",
             forHandle=self.channel_handle,
         )
-        response = request.execute()
+        response = await self._execute_async(request)
 
         if len(response["items"]) > 1:
             raise RuntimeError("More than one response received, handle is ambiguous")
-        sleep(1)  # nap to avoid flooding the API
-        return response["items"][0]["id"]
+        self._channel_response = response
+
+    @property
+    def _channel(self) -> dict:
+        """The first item in the channels response, once it's been prefetched."""
+        if self._channel_response is None:
+            raise RuntimeError("call await prefetch() first")
+        return self._channel_response["items"][0]
+
+    @property
+    def channel_id(self) -> str:
+        """The channel_id from the first item in the channels response."""
+        return self._channel["id"]
 
-    @cached_property
+    @property
     def uploads_id(self) -> str:
-        """If the playlist ID for the 'uploads' playlist hasn't been fetched, do so.
+        """The playlist ID for the channel's 'uploads' playlist.
 
-        Calls the channels resource, list request, filtering by channel_handle to get
-        the "uploads" playlist id from the "relatedPlaylists" contendDetails. We're
-        going to assume that only one channel exists per handle and throw an error if
-        there's two.
+        Read from the "relatedPlaylists" contentDetails of the first item in the
+        channels response.
         """
-        request = self.api.channels().list(
-            part="id,contentDetails", forHandle=self.channel_handle
-        )
-        response = request.execute()
-
-        if len(response["items"]) > 1:
-            raise RuntimeError("More than one response received, channel id ambiguous")
-        sleep(1)
-        return response["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
+        return self._channel["contentDetails"]["relatedPlaylists"]["uploads"]
 
-    @cached_property
+    @property
     def video_ids(self) -> list[str]:
-        """If all the video IDs for this channel haven't been fetched, do so.
+        """All the video IDs for this channel, once they've been prefetched."""
+        if self._video_ids is None:
+            raise RuntimeError("call await prefetch() first")
+        return self._video_ids
+
+    async def _iter_video_id_pages(self) -> AsyncIterator[list[str]]:
+        """Page through the video IDs for this channel, up to 50 at a time.
 
         Calls the playlistItems resource, list request, filtering by uploads_id to get
-        all the video ids for the "uploads" playlist for our youtube channel. We
-        iterate over the response to build a list of video ids associated with our
-        channel.
+        the video ids for the "uploads" playlist for our youtube channel. Each page is
+        yielded as soon as it comes back, and a page of 50 is exactly one batch for
+        _fetch_video_batch_async. If prefetch has already collected the video ids, they
+        get paged out of video_ids instead.
         """
+        if self._video_ids is not None:
+            for i in range(0, len(self._video_ids), 50):
+                yield self._video_ids[i : i + 50]
+            return
+
         request = self.api.playlistItems().list(
             part="snippet",
             playlistId=self.uploads_id,
             maxResults=50,
         )
-        video_ids = []
         while request:
-            try:
-                response = request.execute()
-
-                for item in response["items"]:
-                    resource = item["snippet"]["resourceId"]
-                    if resource["kind"] == "youtube#video":
-                        video_id = resource["videoId"]
-                        video_ids.append(video_id)
-                request = self.api.playlistItems().list_next(request, response)
-                sleep(1)  # nap to avoid breaking the api
-            except Exception as e:
-                print(str(e))
-                print(traceback.format_exc())
-                break
-        return video_ids
-
-    def fetch_videos(self) -> pl.DataFrame:
+            response = await self._execute_async(request)
+
+            yield [
+                item["snippet"]["resourceId"]["videoId"]
+                for item in response["items"]
+                if item["snippet"]["resourceId"]["kind"] == "youtube#video"
+            ]
+            request = self.api.playlistItems().list_next(request, response)
+
+    def fetch_videos(
+        self, out_path: str | Path | None = None
+    ) -> pl.DataFrame | pl.LazyFrame:
         """Fetch a dataframe with basic stats for all videos for this channel.
 
-        _fetch_video_batch does the heavy lifting, this just iterates through all of
-        the video ids.
+        Runs fetch_videos_async in a new event loop. From inside a running event
+        loop (eg a notebook), await fetch_videos_async instead.
+
+        Parameters
+        ----------
+        out_path : str | Path | None
+            If given, write each batch of videos to a parquet file in this directory
+            and return a LazyFrame over them rather than holding them all in memory.
+            Batches already written by an earlier run are reused, see
+            fetch_videos_async
 
         Returns
         -------
-        pl.DataFrame
+        pl.DataFrame | pl.LazyFrame
             The stats for all of the videos associated with this channel
 
         """
-        df = pl.DataFrame(
-            schema={
-                "video_id": str,
-                "published_dt": str,
-                "video_title": str,
-                "video_description": str,
-                "video_tags": list[str],
-                "view_cnt": str,
-                "like_cnt": str,
-                "fave_cnt": str,
-                "comment_cnt": str,
-            }
-        )
-        # Batch videos 50 at a time
-        for i in range(0, len(self.video_ids), 50):
-            video_batch = self.video_ids[i : i + 50]
-            df2 = self._fetch_video_batch(video_batch)
-            sleep(1)  # nap to avoid breaking the api
-            df = pl.concat([df, df2])
+        return asyncio.run(self.fetch_videos_async(out_path))
 
-        return df
+    async def fetch_videos_async(
+        self, out_path: str | Path | None = None
+    ) -> pl.DataFrame | pl.LazyFrame:
+        """Fetch a dataframe with basic stats for all videos, batches run concurrently.
 
-    def _fetch_video_batch(self, video_batch: list[str]) -> pl.DataFrame:
+        _fetch_video_batch_async does the heavy lifting, this just hands it each page
+        of video ids as they're paged in.
+
+        Parameters
+        ----------
+        out_path : str | Path | None
+            If given, write each batch of videos to a parquet file in this directory
+            and return a LazyFrame over them rather than holding them all in memory.
+            Files are named by a hash of the video ids in the batch, so a rerun skips
+            any batch an earlier run already wrote and picks up where it left off.
+            Reused batches keep the stats from when they were written. If the channel
+            uploads in between, the pages shift and every batch gets fetched again
+
+        Returns
+        -------
+        pl.DataFrame | pl.LazyFrame
+            The stats for all of the videos associated with this channel
+
+        """
+        await self._prefetch_channel()
+        if out_path is not None:
+            out_path = Path(out_path)
+            out_path.mkdir(parents=True, exist_ok=True)
+
+        async def fetch_batch(video_batch: list[str]) -> pl.DataFrame | Path:
+            if out_path is None:
+                return await self._fetch_video_batch_async(video_batch)
+
+            key = hashlib.sha256(",".join(video_batch).encode()).hexdigest()[:16]
+            path = out_path / f"batch={key}.parquet"
+            if path.exists():
+                # written by an earlier run
+                return path
+            df = await self._fetch_video_batch_async(video_batch)
+            return await self._write_batch(df, path)
+
+        # Fetch each page of video ids as a batch while the next page is paged in
+        frames = await self._gather_batches(fetch_batch, self._iter_video_id_pages())
+
+        if out_path is not None:
+            return self._scan_batches(frames, VIDEO_SCHEMA)
+        if not frames:
+            return pl.DataFrame(schema=VIDEO_SCHEMA)
+        # concat once at the end, concatenating inside the loop copies the growing
+        # dataframe on every batch
+        return pl.concat(frames)
+
+    def fetch_all_comments(self) -> pl.DataFrame:
+        """Fetch a dataframe with all the comments for every video on this channel.
+
+        Runs fetch_all_comments_async in a new event loop. From inside a running event
+        loop (eg a notebook), await fetch_all_comments_async instead.
+
+        Returns
+        -------
+        pl.DataFrame
+            The comments for all of the videos, along with the video they're on
+
+        """
+        return asyncio.run(self.fetch_all_comments_async())
+
+    async def fetch_all_comments_async(self) -> pl.DataFrame:
+        """Fetch a dataframe with all the comments for every video on this channel.
+
+        Rather than a request per video, the commentThreads requests for up to
+        MAX_BATCH_REQUESTS videos get packed into one batch http request. Videos with
+        more than a page of comments get their next page in a later batch, and so do
+        requests the api throttled, after backing off. Videos with comments disabled,
+        or that are private or gone, are skipped. Errors that would hit every video,
+        like running out of quota, are raised. Awaits prefetch first, if it hasn't been.
+
+        Returns
+        -------
+        pl.DataFrame
+            The comments for all of the videos, along with the video they're on
+
+        """
+        await self.prefetch()
+
+        pending: dict[str, HttpRequest] = {
+            video_id: self.api.commentThreads().list(
+                part="snippet,replies",
+                videoId=video_id,
+                maxResults=100,
+            )
+            for video_id in self.video_ids
+        }
+        in_flight: dict[str, HttpRequest] = {}
+        attempts: dict[str, int] = {}
+        retry_delays: list[float] = []
+        frames: list[pl.DataFrame] = []
+        errors: list[HttpError] = []
+
+        def collect(video_id: str, response: dict, exception: HttpError | None) -> None:
+            request = in_flight.pop(video_id)
+            if exception is not None:
+                attempt = attempts.get(video_id, 0) + 1
+                if _comments_disabled(exception):
+                    logger.info("Comments are disabled for %s, skipping", video_id)
+                elif exception.resp.status in RETRY_STATUSES and attempt < MAX_ATTEMPTS:
+                    # throttled, try this page again in a later batch
+                    attempts[video_id] = attempt
+                    retry_delays.append(_retry_delay(exception, attempt))
+                    pending[video_id] = request
+                elif (reason := _error_reason(exception)) in UNREADABLE_VIDEO_REASONS:
+                    logger.warning(
+                        "Comments for %s can't be read (%s), skipping", video_id, reason
+                    )
+                else:
+                    logger.error(
+                        "Comments for %s failed (%s), giving up",
+                        video_id,
+                        exception.resp.status,
+                    )
+                    errors.append(exception)
+                return
+
+            attempts.pop(video_id, None)
+            frames.append(
+                self._parse_comment_response(response).select(
+                    pl.lit(video_id).alias("video_id"), pl.all()
+                )
+            )
+            next_request = self.api.commentThreads().list_next(request, response)
+            if next_request is not None:
+                pending[video_id] = next_request
+
+        while pending:
+            batch = self.api.new_batch_http_request(callback=collect)
+            for video_id in list(pending)[:MAX_BATCH_REQUESTS]:
+                in_flight[video_id] = pending.pop(video_id)
+                batch.add(in_flight[video_id], request_id=video_id)
+            await asyncio.to_thread(_execute_with_retry, batch, cost=len(in_flight))
+            if errors:
+                raise errors[0]
+            if retry_delays:
+                delay = max(retry_delays)
+                retry_delays.clear()
+                logger.warning(
+                    "Some comment requests were throttled, retrying in %.1fs", delay
+                )
+                await asyncio.sleep(delay)
+
+        if not frames:
+            return pl.DataFrame(schema=CHANNEL_COMMENT_SCHEMA)
+        return pl.concat(frames)
+
+    async def _fetch_video_batch_async(self, video_batch: list[str]) -> pl.DataFrame:
         """Fetch a batch of up to 50 results at a time.
 
         Make iterating so much easier.
@@ -343,63 +1003,26 @@ class Channel(Youtube):
             id=video_ids,
             maxResults=50,
         )
-        response = request.execute()
-
-        video_ids: list[str] = []
-        published_dts: list[str] = []
-        video_titles: list[str] = []
-        video_descriptions: list[str] = []
-        video_tags: list[list[str]] = []
-        view_cnts: list[str] = []
-        like_cnts: list[str] = []
-        fave_cnts: list[str] = []
-        comment_cnts: list[str] = []
+        response = await self._execute_async(request)
 
-        for item in response["items"]:
-            if item["kind"] == "youtube#video":
-                # Extract the info
-                video_id = item["id"]
-                video_ids.append(video_id)
-
-                snippet = item["snippet"]
-
-                published_dt = snippet["publishedAt"]
-                published_dts.append(published_dt)
-
-                video_title = snippet["title"]
-                video_titles.append(video_title)
-
-                video_description = snippet["description"]
-                video_descriptions.append(video_description)
-
-                video_tag = snippet["tags"]
-                video_tags.append(video_tag)
-
-                stats = item["statistics"]
-
-                view_cnt = stats["viewCount"]
-                view_cnts.append(view_cnt)
-
-                like_cnt = stats["likeCount"]
-                like_cnts.append(like_cnt)
-
-                fave_cnt = stats["favoriteCount"]
-                fave_cnts.append(fave_cnt)
-
-                comment_cnt = stats["commentCount"]
-                comment_cnts.append(comment_cnt)
-        df = pl.DataFrame(
+        items = [item for item in response["items"] if item["kind"] == "youtube#video"]
+        snippets = [item["snippet"] for item in items]
+        stats = [item["statistics"] for item in items]
+        return pl.DataFrame(
             data={
-                "video_id": video_ids,
-                "published_dt": published_dts,
-                "video_title": video_titles,
-                "video_description": video_descriptions,
-                "video_tags": video_tags,
-                "view_cnt": view_cnts,
-                "like_cnt": like_cnts,
-                "fave_cnt": fave_cnts,
-                "comment_cnt": comment_cnts,
-            }
+                "video_id": [item["id"] for item in items],
+                "published_dt": [
+                    datetime.fromisoformat(snippet["publishedAt"])
+                    for snippet in snippets
+                ],
+                "video_title": [snippet["title"] for snippet in snippets],
+                "video_description": [snippet["description"] for snippet in snippets],
+                # untagged videos don't have tags
+                "video_tags": [snippet.get("tags", []) for snippet in snippets],
+                "view_cnt": [_count(stat, "viewCount") for stat in stats],
+                "like_cnt": [_count(stat, "likeCount") for stat in stats],
+                "fave_cnt": [_count(stat, "favoriteCount") for stat in stats],
+                "comment_cnt": [_count(stat, "commentCount") for stat in stats],
+            },
+            schema=VIDEO_SCHEMA,
         )
-
-        return df